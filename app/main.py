@@ -2,13 +2,18 @@
 FastAPI application for Question-Answering bot using LangChain.
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import asyncio
+import json
+from fastapi import Depends, FastAPI, File, Form, Response, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
 import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 from dotenv import load_dotenv
 
 from app.services.document_loader import DocumentLoader
 from app.services.qa_service import QAService
-from app.models.schemas import QAResponse
+from app.models.schemas import BatchJobResponse, QAMode, QAResponse
 
 load_dotenv()
 
@@ -19,16 +24,39 @@ app = FastAPI(
 )
 
 
+@lru_cache
+def get_qa_service() -> QAService:
+    """Return the process-wide QA service, so OpenAI clients and their connection pools are reused."""
+    return QAService()
+
+
+@lru_cache
+def get_document_loader() -> DocumentLoader:
+    """Return the process-wide document loader."""
+    return DocumentLoader()
+
+
+@app.on_event("startup")
+async def validate_environment():
+    """Fail fast at startup if the OpenAI API key is missing."""
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY not found in environment variables")
+
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
     return {"message": "Question-Answering API is running"}
 
 
-@app.post("/qa", response_model=QAResponse)
+@app.post("/qa", response_model=Union[QAResponse, BatchJobResponse])
 async def answer_questions(
+    response: Response,
     document: UploadFile = File(..., description="Document file (PDF or JSON)"),
     questions_file: UploadFile = File(..., description="JSON file containing list of questions"),
+    mode: QAMode = Form("interactive", description="'interactive' for immediate answers, 'batch' for the OpenAI Batch API"),
+    qa_service: QAService = Depends(get_qa_service),
+    document_loader: DocumentLoader = Depends(get_document_loader),
 ):
     """
     Answer questions based on document content.
@@ -36,18 +64,143 @@ async def answer_questions(
     Args:
         document: PDF or JSON file containing the document content
         questions_file: JSON file containing a list of questions
+        mode: Answering mode; 'batch' trades latency for lower cost on bulk workloads
+
+    Returns:
+        JSON response with question-answer pairs; in batch mode, a 202 response with the
+        batch job to poll at /qa/batch/{batch_id} (unless every answer was cached)
+    """
+    try:
+        document_content, questions, document_metadata = await _load_inputs(document_loader, document, questions_file)
+
+        if mode == "batch":
+            job = await qa_service.submit_batch(
+                document_content=document_content, questions=questions, document_metadata=document_metadata
+            )
+            if job["answers"] is None:
+                response.status_code = 202
+            return BatchJobResponse(**job)
+
+        # Process questions and get answers using RAG
+        qa_pairs = await qa_service.answer_questions(
+            document_content=document_content, questions=questions, document_metadata=document_metadata
+        )
+
+        return QAResponse(answers=qa_pairs)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@app.get("/qa/batch/{batch_id}", response_model=BatchJobResponse)
+async def get_batch(batch_id: str, qa_service: QAService = Depends(get_qa_service)):
+    """
+    Return the status of a batch job submitted with mode=batch, with its answers once finished.
+
+    Args:
+        batch_id: ID returned when the batch job was submitted
 
     Returns:
-        JSON response with question-answer pairs
+        JSON response with the batch status and, once finished, question-answer pairs
     """
     try:
-        # Validate OpenAI API key
-        if not os.getenv("OPENAI_API_KEY"):
-            raise HTTPException(status_code=500, detail="OPENAI_API_KEY not found in environment variables")
+        return BatchJobResponse(**await qa_service.get_batch(batch_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@app.post("/qa/stream")
+async def stream_answers(
+    document: UploadFile = File(..., description="Document file (PDF or JSON)"),
+    questions_file: UploadFile = File(..., description="JSON file containing list of questions"),
+    qa_service: QAService = Depends(get_qa_service),
+    document_loader: DocumentLoader = Depends(get_document_loader),
+):
+    """
+    Answer questions based on document content, streaming tokens as Server-Sent Events.
 
-        # Load and process document
-        document_loader = DocumentLoader()
+    Questions are answered concurrently. Each "token" event carries a piece of an
+    answer and each question ends with a "done" event holding its full answer; both
+    include the question_id so clients can demultiplex the streams.
 
+    Args:
+        document: PDF or JSON file containing the document content
+        questions_file: JSON file containing a list of questions
+
+    Returns:
+        text/event-stream response
+    """
+    document_content, questions, document_metadata = await _load_inputs(document_loader, document, questions_file)
+
+    async def event_stream():
+        try:
+            async for event in qa_service.stream_answers(
+                document_content=document_content, questions=questions, document_metadata=document_metadata
+            ):
+                yield _sse(event.pop("event"), event)
+        except Exception as e:
+            # The response has already started, so errors are reported in-band
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.post("/qa/ndjson")
+async def stream_answer_pairs(
+    document: UploadFile = File(..., description="Document file (PDF or JSON)"),
+    questions_file: UploadFile = File(..., description="JSON file containing list of questions"),
+    qa_service: QAService = Depends(get_qa_service),
+    document_loader: DocumentLoader = Depends(get_document_loader),
+):
+    """
+    Answer questions based on document content, streaming each pair as newline-delimited JSON.
+
+    Each line is a {"question", "answer"} object, written as soon as that answer is
+    complete, so the first finished answer reaches the client immediately.
+
+    Args:
+        document: PDF or JSON file containing the document content
+        questions_file: JSON file containing a list of questions
+
+    Returns:
+        application/x-ndjson response
+    """
+    document_content, questions, document_metadata = await _load_inputs(document_loader, document, questions_file)
+
+    async def pair_stream():
+        try:
+            async for pair in qa_service.iter_answers(
+                document_content=document_content, questions=questions, document_metadata=document_metadata
+            ):
+                yield json.dumps(pair) + "\n"
+        except Exception as e:
+            # The response has already started, so errors are reported in-band
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(pair_stream(), media_type="application/x-ndjson")
+
+
+async def _load_inputs(
+    document_loader: DocumentLoader, document: UploadFile, questions_file: UploadFile
+) -> Tuple[str, List[str], Optional[List[Dict]]]:
+    """
+    Load the document and questions of a QA request.
+
+    Returns:
+        Tuple of (document content, questions, page metadata for PDFs or None)
+
+    Raises:
+        HTTPException: 400 for invalid inputs, 500 for unexpected errors
+    """
+    try:
         # Load questions first
         questions_data = await document_loader.load_questions(questions_file)
         questions = questions_data.get("questions", [])
@@ -55,53 +208,36 @@ async def answer_questions(
         if not questions:
             raise HTTPException(status_code=400, detail="No questions found in the questions file")
 
-        # For PDFs, try to load with metadata for better chunking
+        # For PDFs, load with page metadata for better chunking
         document_metadata = None
-        document_content = None
 
         if document.filename and document.filename.lower().endswith(".pdf"):
-            # Read file content once
-            file_content = await document.read()
-
-            try:
-                # Create a file wrapper for metadata loading
-                class FileWrapper:
-                    def __init__(self, content, filename):
-                        self.content = content
-                        self.filename = filename
-
-                    async def read(self):
-                        return self.content
-
-                file_wrapper = FileWrapper(file_content, document.filename)
-                document_metadata = await document_loader.load_pdf_with_metadata(file_wrapper)
-
-                # Also get the text content
-                document_content = document_loader._load_pdf(file_content)
-            except Exception:
-                # Fall back to standard loading if metadata extraction fails
-                document_content = document_loader._load_pdf(file_content)
-                document_metadata = None
+            # Stream the upload to disk and parse it once; page texts also form the full document
+            async with document_loader.spool_upload(document) as pdf_path:
+                # PDF extraction is CPU-bound; keep it off the event loop
+                document_metadata = await asyncio.get_running_loop().run_in_executor(
+                    None, document_loader.load_pdf_with_metadata, pdf_path, document.filename
+                )
+            document_content = "\n\n".join(page["text"] for page in document_metadata)
         else:
             # For non-PDF files, use standard loading
             document_content = await document_loader.load_document(document)
 
-        # Initialize QA service
-        qa_service = QAService()
-
-        # Process questions and get answers using RAG
-        qa_pairs = await qa_service.answer_questions(
-            document_content=document_content, questions=questions, document_metadata=document_metadata
-        )
-
-        return QAResponse(answers=qa_pairs)
+        return document_content, questions, document_metadata
 
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+def _sse(event: str, data: Dict) -> str:
+    """Format a Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -3,7 +3,10 @@ Pydantic schemas for request/response models.
 """
 
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Literal, Optional
+
+# Answering mode for the QA endpoint
+QAMode = Literal["interactive", "batch"]
 
 
 class QARequest(BaseModel):
@@ -14,6 +17,14 @@ class QARequest(BaseModel):
 
 
 class QAResponse(BaseModel):
-    """Response model for QA endpoint."""
+    """Response model for QA endpoint; each answer is a {"question", "answer"} dictionary."""
 
     answers: List[Dict[str, str]]
+
+
+class BatchJobResponse(BaseModel):
+    """Response model for batch jobs; answers are set once the job has finished."""
+
+    batch_id: Optional[str]
+    status: str
+    answers: Optional[List[Dict[str, str]]] = None
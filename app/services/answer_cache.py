@@ -0,0 +1,127 @@
+"""
+Semantic cache for answers to previously asked questions.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Caches answers per document and serves them for semantically similar questions.
+
+    Each document gets its own inner-product FAISS index over normalized question
+    embeddings, so search scores are cosine similarities. A hit additionally requires
+    that the new question retrieved mostly the same chunks as the cached one, which
+    guards against paraphrases that are close in embedding space but need different
+    context to answer.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.93,
+        min_chunk_overlap: float = 0.5,
+        max_documents: int = 128,
+        max_entries_per_document: int = 1000,
+    ):
+        """
+        Initialize an empty cache.
+
+        Args:
+            similarity_threshold: Minimum cosine similarity between questions for a hit
+            min_chunk_overlap: Minimum Jaccard overlap of retrieved chunk IDs for a hit
+            max_documents: Number of documents kept before the least recently used is dropped
+            max_entries_per_document: Number of answers kept per document
+        """
+        self.similarity_threshold = similarity_threshold
+        self.min_chunk_overlap = min_chunk_overlap
+        self.max_documents = max_documents
+        self.max_entries_per_document = max_entries_per_document
+        self._documents: "OrderedDict[str, Tuple[faiss.IndexFlatIP, List[Tuple[frozenset, str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, document_hash: str, question_vector: List[float], chunks: Iterable[str]) -> Optional[str]:
+        """
+        Return a cached answer for a similar question about the same document, if any.
+
+        Args:
+            document_hash: Hash identifying the document
+            question_vector: Embedding of the incoming question
+            chunks: Texts of the chunks retrieved for the incoming question
+
+        Returns:
+            The cached answer, or None on a miss
+        """
+        with self._lock:
+            cached = self._documents.get(document_hash)
+            if cached is None or cached[0].ntotal == 0:
+                return None
+            self._documents.move_to_end(document_hash)
+            index, entries = cached
+
+            scores, ids = index.search(self._normalize(question_vector), 1)
+            if scores[0, 0] < self.similarity_threshold:
+                return None
+
+            cached_chunks, answer = entries[ids[0, 0]]
+            chunk_ids = self.chunk_digests(chunks)
+            union = chunk_ids | cached_chunks
+            if union and len(chunk_ids & cached_chunks) / len(union) < self.min_chunk_overlap:
+                return None
+            return answer
+
+    def add(self, document_hash: str, question_vector: List[float], chunks: Iterable[str], answer: str):
+        """
+        Store an answer for a question about a document.
+
+        Args:
+            document_hash: Hash identifying the document
+            question_vector: Embedding of the answered question
+            chunks: Texts of the chunks retrieved for the question
+            answer: Answer to cache
+        """
+        self.add_digests(document_hash, question_vector, self.chunk_digests(chunks), answer)
+
+    def add_digests(self, document_hash: str, question_vector: List[float], chunk_digests: Iterable[bytes], answer: str):
+        """
+        Store an answer like add, given the chunk_digests of the retrieved chunks instead of their texts.
+
+        Used when the answer arrives after the chunks are gone, such as for batch jobs.
+        """
+        vector = self._normalize(question_vector)
+        with self._lock:
+            cached = self._documents.get(document_hash)
+            if cached is None:
+                cached = (faiss.IndexFlatIP(vector.shape[1]), [])
+                self._documents[document_hash] = cached
+                if len(self._documents) > self.max_documents:
+                    self._documents.popitem(last=False)
+            self._documents.move_to_end(document_hash)
+
+            index, entries = cached
+            if len(entries) >= self.max_entries_per_document:
+                return
+            index.add(vector)
+            entries.append((frozenset(chunk_digests), answer))
+
+    @staticmethod
+    def chunk_digests(chunks: Iterable[str]) -> frozenset:
+        """
+        Return short digests identifying chunks.
+
+        Entries only keep these digests, never the chunk texts themselves, which can be
+        large (small documents are passed whole as their own single chunk).
+        """
+        return frozenset(hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).digest() for chunk in chunks)
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        """Return the vector as a normalized (1, dim) float32 matrix."""
+        matrix = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(matrix)
+        return matrix
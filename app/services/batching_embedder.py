@@ -0,0 +1,114 @@
+"""
+Embeddings wrapper that coalesces concurrent embedding requests into shared batches.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+
+class BatchingEmbedder(Embeddings):
+    """
+    Dynamically batches embed_documents calls across concurrent callers.
+
+    Texts submitted within a short window are combined into a single call to the
+    wrapped embeddings, and each caller receives its own slice of the result. This
+    amortizes the per-request overhead of the embeddings API when several QA requests
+    are in flight. Callers may be coroutines or worker threads (index builds run in
+    an executor), so requests are queued on a thread-safe queue and resolved through
+    concurrent futures.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = 2048, max_wait_ms: float = 10, max_workers: int = 4):
+        """
+        Initialize the batching wrapper.
+
+        Args:
+            embeddings: Embeddings implementation that performs the actual calls
+            max_batch: Number of texts after which a batch is sent without waiting
+            max_wait_ms: Time to wait for more requests after the first one arrives
+            max_workers: Number of batches that may be in flight at once
+        """
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed-batch")
+        self._collector: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, sharing the underlying call with concurrent requests."""
+        return self._submit(texts).result()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts asynchronously, sharing the underlying call with concurrent requests."""
+        return await asyncio.wrap_future(self._submit(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query text."""
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query text asynchronously."""
+        return await self.embeddings.aembed_query(text)
+
+    def _submit(self, texts: List[str]) -> Future:
+        """Queue texts for the next batch and return a future for their vectors."""
+        future: Future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+
+        with self._lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name="embed-collector", daemon=True)
+                self._collector.start()
+        self._queue.put((list(texts), future))
+        return future
+
+    def _collect(self):
+        """Gather queued requests into batches and hand each batch to the executor."""
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            self._executor.submit(self._embed_batch, pending)
+
+    def _embed_batch(self, pending: List[Tuple[List[str], Future]]):
+        """Embed one combined batch and resolve each caller's future with its slice."""
+        # Callers that were cancelled while queued (e.g. a disconnected client) are dropped;
+        # their futures must not be resolved, or the remaining callers would never be
+        pending = [(batch, future) for batch, future in pending if future.set_running_or_notify_cancel()]
+        if not pending:
+            return
+
+        texts = [text for batch, _ in pending for text in batch]
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for batch, future in pending:
+            future.set_result(vectors[offset : offset + len(batch)])
+            offset += len(batch)
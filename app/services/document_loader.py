@@ -2,11 +2,68 @@
 Service for loading and processing documents and questions.
 """
 
-import json
+import asyncio
+import os
+import orjson
+import aiofiles
+import aiofiles.tempfile
 import pypdf
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import UploadFile
-from typing import Dict, List
-import io
+from itertools import repeat
+from typing import AsyncIterator, Dict, List
+
+try:
+    # PyMuPDF is a C binding and several times faster than pypdf; it is optional
+    # because of its AGPL license, with pypdf used when it is not installed
+    import fitz
+except ImportError:  # pragma: no cover - depends on the deployment
+    fitz = None
+
+# PDFs with fewer pages are extracted in-process; below it, spawning workers that each parse
+# the whole document costs more than extracting the pages sequentially
+PARALLEL_PDF_MIN_PAGES = 32
+
+# Upper bound on worker processes for per-page PDF text extraction
+PDF_MAX_WORKERS = 8
+
+# Uploads are streamed to disk in chunks of this size instead of being read into memory at once
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Extract text from a contiguous range of PDF pages with pypdf; runs in a worker process."""
+    # Parsing the document dominates extracting one page, so each worker parses it only once
+    reader = pypdf.PdfReader(path)
+    return [reader.pages[page_idx].extract_text() for page_idx in range(start, stop)]
+
+
+def _extract_pages(path: str) -> List[str]:
+    """
+    Extract text from every page of a PDF.
+
+    Uses PyMuPDF when available. Otherwise falls back to pypdf, which is pure Python
+    and GIL-bound, so large PDFs are split into contiguous page ranges across worker
+    processes, each parsing the document once and extracting its own range.
+    """
+    if fitz is not None:
+        with fitz.open(path, filetype="pdf") as doc:
+            return [page.get_text("text") for page in doc]
+
+    pdf_reader = pypdf.PdfReader(path)
+    n_pages = len(pdf_reader.pages)
+    n_workers = min(os.cpu_count() or 1, PDF_MAX_WORKERS, n_pages)
+
+    if n_pages < PARALLEL_PDF_MIN_PAGES or n_workers == 1:
+        return [page.extract_text() for page in pdf_reader.pages]
+
+    range_size = -(-n_pages // n_workers)  # ceil division
+    starts = range(0, n_pages, range_size)
+    stops = [min(start + range_size, n_pages) for start in starts]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        ranges = executor.map(_extract_page_range, repeat(path), starts, stops)
+        return [page_text for page_texts in ranges for page_text in page_texts]
 
 
 class DocumentLoader:
@@ -22,25 +79,48 @@ class DocumentLoader:
         Returns:
             Document content as string
         """
-        content = await file.read()
         file_extension = file.filename.split(".")[-1].lower()
 
-        if file_extension == "pdf":
-            return self._load_pdf(content)
-        elif file_extension == "json":
-            return self._load_json_document(content)
-        else:
+        if file_extension not in ("pdf", "json"):
             raise ValueError(f"Unsupported file type: {file_extension}. Supported types: PDF, JSON")
 
-    def _load_pdf(self, content: bytes) -> str:
-        """Extract text from PDF content."""
+        parse = self._load_pdf if file_extension == "pdf" else self._load_json_document
+        async with self.spool_upload(file) as path:
+            # Parsing is blocking, CPU-bound work; keep it off the event loop
+            return await asyncio.get_running_loop().run_in_executor(None, parse, path)
+
+    @asynccontextmanager
+    async def spool_upload(self, file: UploadFile) -> AsyncIterator[str]:
+        """
+        Stream an uploaded file to a temporary file on disk.
+
+        Reads the upload in fixed-size chunks, so memory use stays constant regardless
+        of file size and the event loop is not blocked on one large read.
+
+        Args:
+            file: Uploaded file
+
+        Yields:
+            Path of the temporary file, which is removed on exit
+        """
+        path = None
+        try:
+            # Remove the file even if reading the upload or writing to disk fails midway
+            async with aiofiles.tempfile.NamedTemporaryFile("wb", delete=False) as tmp:
+                path = tmp.name
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await tmp.write(chunk)
+            yield path
+        finally:
+            if path is not None:
+                os.unlink(path)
+
+    def _load_pdf(self, path: str) -> str:
+        """Extract text from a PDF file on disk."""
         try:
-            pdf_file = io.BytesIO(content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
             text_parts = []
 
-            for page_num, page in enumerate(pdf_reader.pages, start=1):
-                page_text = page.extract_text()
+            for page_text in _extract_pages(path):
                 if page_text.strip():  # Only add non-empty pages
                     text_parts.append(page_text)
 
@@ -48,40 +128,38 @@ class DocumentLoader:
         except Exception as e:
             raise ValueError(f"Error reading PDF file: {str(e)}")
 
-    async def load_pdf_with_metadata(self, file: UploadFile) -> List[Dict]:
+    def load_pdf_with_metadata(self, path: str, filename: str) -> List[Dict]:
         """
         Load PDF with page-level metadata for better chunking.
 
         Args:
-            file: Uploaded PDF file
+            path: Path of the PDF file on disk (see spool_upload)
+            filename: Original filename, recorded as the page source
 
         Returns:
             List of dictionaries with page text and metadata
         """
-        content = await file.read()
-        file_extension = file.filename.split(".")[-1].lower()
+        file_extension = filename.split(".")[-1].lower()
 
         if file_extension != "pdf":
             raise ValueError("File must be a PDF")
 
         try:
-            pdf_file = io.BytesIO(content)
-            pdf_reader = pypdf.PdfReader(pdf_file)
             pages_data = []
 
-            for page_num, page in enumerate(pdf_reader.pages, start=1):
-                page_text = page.extract_text()
+            for page_num, page_text in enumerate(_extract_pages(path), start=1):
                 if page_text.strip():
-                    pages_data.append({"page_number": page_num, "text": page_text, "source": file.filename})
+                    pages_data.append({"page_number": page_num, "text": page_text, "source": filename})
 
             return pages_data
         except Exception as e:
             raise ValueError(f"Error reading PDF file: {str(e)}")
 
-    def _load_json_document(self, content: bytes) -> str:
-        """Extract text from JSON document."""
+    def _load_json_document(self, path: str) -> str:
+        """Extract text from a JSON document on disk."""
         try:
-            json_data = json.loads(content.decode("utf-8"))
+            with open(path, "rb") as f:
+                json_data = orjson.loads(f.read())
 
             # Handle different JSON structures
             if isinstance(json_data, dict):
@@ -94,13 +172,13 @@ class DocumentLoader:
                     return json_data["document"]
                 else:
                     # Convert entire dict to string representation
-                    return json.dumps(json_data, indent=2)
+                    return orjson.dumps(json_data, option=orjson.OPT_INDENT_2).decode("utf-8")
             elif isinstance(json_data, list):
                 # If it's a list, join all items
                 return "\n".join(str(item) for item in json_data)
             else:
                 return str(json_data)
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"Error parsing JSON file: {str(e)}")
         except Exception as e:
             raise ValueError(f"Error reading JSON file: {str(e)}")
@@ -115,14 +193,15 @@ class DocumentLoader:
         Returns:
             Dictionary containing questions list
         """
-        content = await file.read()
         file_extension = file.filename.split(".")[-1].lower()
 
         if file_extension != "json":
             raise ValueError("Questions file must be a JSON file")
 
         try:
-            json_data = json.loads(content.decode("utf-8"))
+            async with self.spool_upload(file) as path:
+                async with aiofiles.open(path, "rb") as f:
+                    json_data = orjson.loads(await f.read())
 
             # Handle different JSON structures
             if isinstance(json_data, dict):
@@ -141,7 +220,7 @@ class DocumentLoader:
                 return {"questions": json_data}
             else:
                 raise ValueError("Invalid JSON structure for questions file")
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"Error parsing questions JSON file: {str(e)}")
         except Exception as e:
             raise ValueError(f"Error reading questions file: {str(e)}")
@@ -2,22 +2,225 @@
 Service for question-answering using LangChain and OpenAI.
 """
 
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
 import os
-from typing import List, Dict, Optional
+import re
+import shutil
+import stat
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Set, Tuple
+import faiss
+import httpx
+import numpy as np
+import tiktoken
+from openai import AsyncOpenAI
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.batching_embedder import BatchingEmbedder
+
+logger = logging.getLogger(__name__)
+
+# Number of chunks retrieved per question
+RETRIEVAL_K = 10
+
+# Documents under this many tokens are sent whole instead of being chunked and retrieved from
+CAG_MAX_TOKENS = 30_000
+
+# Upper bound on concurrent LLM calls, to stay within OpenAI rate limits
+MAX_CONCURRENCY = int(os.getenv("QA_MAX_CONCURRENCY", "8"))
+
+# Chunk counts from which the exact (flat) FAISS index is replaced by an approximate one:
+# HNSW over int8 scalar-quantized vectors for low-latency search, IVF-PQ for very large
+# corpora where memory dominates
+HNSW_MIN_CHUNKS = 10_000
+IVFPQ_MIN_CHUNKS = 200_000
+
+# HNSW graph parameters
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# IVF-PQ parameters: PQ_M sub-quantizers must divide the embedding dimension (1536)
+IVF_NLIST = 1024
+IVF_NPROBE = 32
+PQ_M = 16
+PQ_NBITS = 8
+
+# Number of vectors sampled to train quantizers
+TRAINING_SAMPLE = 100_000
+
+# Connection pool limits for the HTTP clients shared by all OpenAI calls
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=100)
+
+# Process-wide semantic cache of answers to previously asked questions
+ANSWER_CACHE = SemanticAnswerCache()
+
+# Directories already reported as untrusted by _ensure_private_dir
+_REJECTED_DIRS: Set[Path] = set()
+
+# Default size cap for the on-disk FAISS index cache
+FAISS_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+
+# OpenAI Batch API settings for non-interactive workloads
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+BATCH_ID_PATTERN = re.compile(r"batch_[A-Za-z0-9]+")
+
+# Enhanced prompt for better RAG responses.
+# Ordered for provider-side prompt caching, which keys on the longest common prefix:
+# static instructions first, then context shared by every question of the request,
+# and only then the per-question context and the question itself.
+PROMPT_INSTRUCTIONS = """You are a helpful assistant that answers questions based on the provided context from a document.
+
+Use the following pieces of context to answer the question accurately and comprehensively.
+- If the answer is not in the context, say "I don't know" based on the provided context.
+- Do not make up information that is not in the context.
+- Provide detailed and accurate answers based solely on the context provided.
+- If multiple relevant pieces of context are provided, synthesize them into a comprehensive answer.
+
+"""
+
+PROMPT_TEMPLATE = PROMPT_INSTRUCTIONS + """Context from document:
+{shared_context}
+
+Additional context for this question:
+{context}
+
+Question: {question}
+
+Provide a clear, accurate answer based on the context above:"""
+
+PROMPT = PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["shared_context", "context", "question"])
+
+# Prompt for questions whose whole context is shared, such as small documents sent in full.
+# It starts with the same static prefix as PROMPT so both benefit from the prompt cache.
+CAG_PROMPT_TEMPLATE = PROMPT_INSTRUCTIONS + """Context from document:
+{context}
+
+Question: {question}
+
+Provide a clear, accurate answer based on the context above:"""
+
+CAG_PROMPT = PromptTemplate(template=CAG_PROMPT_TEMPLATE, input_variables=["context", "question"])
+
+
+def _default_cache_root() -> Path:
+    """Return the per-user cache directory for this service."""
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "zania"
+
+
+def _ensure_private_dir(path: Path) -> bool:
+    """
+    Create a directory readable and writable only by the current user, if missing.
+
+    Returns False, logging a warning once per directory, when the directory cannot be
+    created, is a symlink, belongs to another user or is writable by group/others; files
+    in it must not be trusted then, as someone else could have planted them.
+    """
+    try:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = path.lstat()
+    except OSError as e:
+        return _reject_dir(path, f"cannot be created ({e})")
+    if not stat.S_ISDIR(st.st_mode):
+        return _reject_dir(path, "is not a directory")
+    if st.st_mode & 0o022:
+        return _reject_dir(path, "is writable by group or others")
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return _reject_dir(path, "belongs to another user")
+    return True
+
+
+def _reject_dir(path: Path, reason: str) -> bool:
+    """Warn, once per directory, that an untrusted directory is not used; returns False."""
+    if path not in _REJECTED_DIRS:
+        _REJECTED_DIRS.add(path)
+        logger.warning("Not using %s, which %s", path, reason)
+    return False
+
+
+def _build_ann_index(flat_index: faiss.Index) -> faiss.Index:
+    """
+    Rebuild an exact FAISS index as an approximate one over the same vectors.
+
+    Vector ids are kept in insertion order, so the vector store's docstore mapping
+    stays valid when the returned index replaces the flat one.
+    """
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    dim = flat_index.d
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), TRAINING_SAMPLE), replace=False)]
+
+    if flat_index.ntotal >= IVFPQ_MIN_CHUNKS:
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, IVF_NLIST, PQ_M, PQ_NBITS)
+        index.nprobe = IVF_NPROBE
+    else:
+        # Store vectors as per-dimension int8 codes: a quarter of the FP32 memory and bandwidth
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    # Learns the PQ codebooks, or the per-dimension ranges of the scalar quantizer
+    index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def _read_index(path: str) -> faiss.Index:
+    """Read a FAISS index, memory-mapped read-only where the index type supports it."""
+    try:
+        # IO_FLAG_MMAP_IFC maps the code arrays of flat and scalar-quantized indices (the HNSW
+        # graph itself is still read into memory); plain IO_FLAG_MMAP only applies to IVF lists
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Not every index type can be memory-mapped; fall back to loading it into memory
+        return faiss.read_index(path)
 
 
 class QAService:
     """Handles question-answering using LangChain and vector store with RAG."""
 
-    def __init__(self):
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, answer_cache: Optional[SemanticAnswerCache] = None):
         """Initialize QA service with OpenAI and vector store."""
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=os.getenv("OPENAI_API_KEY"))
-        self.embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+        # Pooled HTTP clients keep OpenAI connections alive across requests; the service is
+        # meant to be created once per process and shared (see app.main.get_qa_service)
+        self._http_client = httpx.Client(limits=HTTP_LIMITS)
+        self._http_async_client = httpx.AsyncClient(limits=HTTP_LIMITS)
+        api_key = os.getenv("OPENAI_API_KEY")
+        self.llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            openai_api_key=api_key,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+        )
+        # Coalesces embedding calls of concurrent requests into shared batches
+        self.embeddings = BatchingEmbedder(
+            OpenAIEmbeddings(openai_api_key=api_key, http_client=self._http_client, http_async_client=self._http_async_client)
+        )
+        self.max_concurrency = max_concurrency
+        # Shared across service instances so answers survive beyond a single request
+        self.answer_cache = answer_cache if answer_cache is not None else ANSWER_CACHE
+        self._index_cache_dir = Path(os.getenv("FAISS_CACHE_DIR") or _default_cache_root() / "faiss")
+        self._index_cache_max_bytes = int(os.getenv("FAISS_CACHE_MAX_BYTES", str(FAISS_CACHE_MAX_BYTES)))
+        self._batch_state_dir = Path(os.getenv("QA_BATCH_STATE_DIR") or _default_cache_root() / "batches")
         # Enhanced chunking strategy for better RAG retrieval
         # Larger chunk size preserves more context, helpful for complex questions
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -36,8 +239,136 @@ class QAService:
         This method:
         1. Chunks the document using an optimized chunking strategy
         2. Creates embeddings and stores them in a vector database
-        3. Retrieves relevant chunks for each question
-        4. Sends retrieved context to LLM for answering
+        3. Embeds all questions in one batch and retrieves relevant chunks for each
+        4. Serves answers for previously seen questions from the semantic answer cache (chunked documents only)
+        5. Sends retrieved context to the LLM concurrently for the remaining questions
+
+        Args:
+            document_content: The document text to answer questions from
+            questions: List of questions to answer
+            document_metadata: Optional metadata about document pages (for PDFs)
+
+        Returns:
+            List of {"question", "answer"} dictionaries, in question order
+        """
+        questions, question_vectors, retrieved = await self._retrieve(document_content, questions, document_metadata)
+        if not questions:
+            return []
+
+        document_hash = self._document_hash(document_content)
+
+        answers = self._lookup_cached_answers(document_hash, question_vectors, retrieved)
+        pending = [idx for idx, answer in enumerate(answers) if answer is None]
+        prompts = self._build_prompts([questions[idx] for idx in pending], [retrieved[idx] for idx in pending])
+
+        # Run all LLM calls through one chain, concurrently up to max_concurrency to respect rate limits
+        results = await self._answer_chain(document_hash).abatch(
+            prompts, config=RunnableConfig(max_concurrency=self.max_concurrency), return_exceptions=True
+        )
+        for idx, result in zip(pending, results):
+            if isinstance(result, Exception):
+                # If there's an error answering a question, return error message
+                answers[idx] = f"Error answering question: {str(result)}"
+                continue
+            self._cache_answer(document_hash, question_vectors, retrieved, idx, result)
+            answers[idx] = result
+        return [{"question": question, "answer": answer} for question, answer in zip(questions, answers)]
+
+    async def stream_answers(
+        self, document_content: str, questions: List[str], document_metadata: Optional[List[Dict]] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Answer questions like answer_questions, yielding tokens as the LLM produces them.
+
+        All questions are answered concurrently, so events of different questions are
+        interleaved; each event carries the question_id (index into the non-empty
+        questions) it belongs to. Every question ends with exactly one "done" event
+        holding the full answer, which is the only event for cached answers.
+
+        Args:
+            document_content: The document text to answer questions from
+            questions: List of questions to answer
+            document_metadata: Optional metadata about document pages (for PDFs)
+
+        Yields:
+            Dictionaries with an "event" key of "token" or "done"
+        """
+        questions, question_vectors, retrieved = await self._retrieve(document_content, questions, document_metadata)
+        if not questions:
+            return
+        document_hash = self._document_hash(document_content)
+
+        answers = self._lookup_cached_answers(document_hash, question_vectors, retrieved)
+        pending = [idx for idx, answer in enumerate(answers) if answer is None]
+        prompts = self._build_prompts([questions[idx] for idx in pending], [retrieved[idx] for idx in pending])
+
+        for idx, answer in enumerate(answers):
+            if answer is not None:
+                yield {"event": "done", "question_id": idx, "question": questions[idx], "answer": answer}
+
+        chain = self._answer_chain(document_hash)
+        events: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def stream(idx: int, prompt: str):
+            # Every task must end with exactly one "done" event, or the consumer below waits forever
+            try:
+                parts = []
+                async with semaphore:
+                    async for token in chain.astream(prompt):
+                        if token:
+                            parts.append(token)
+                            await events.put({"event": "token", "question_id": idx, "token": token})
+                answer = "".join(parts)
+                self._cache_answer(document_hash, question_vectors, retrieved, idx, answer)
+            except Exception as e:
+                answer = f"Error answering question: {str(e)}"
+            await events.put({"event": "done", "question_id": idx, "question": questions[idx], "answer": answer})
+
+        tasks = [asyncio.create_task(stream(idx, prompt)) for idx, prompt in zip(pending, prompts)]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event = await events.get()
+                if event["event"] == "done":
+                    remaining -= 1
+                yield event
+        finally:
+            # Stop generating if the client goes away before every answer is done
+            for task in tasks:
+                task.cancel()
+
+    async def iter_answers(
+        self, document_content: str, questions: List[str], document_metadata: Optional[List[Dict]] = None
+    ) -> AsyncIterator[Dict[str, str]]:
+        """
+        Answer questions like answer_questions, yielding each pair as soon as it is complete.
+
+        Pairs arrive in completion order rather than question order.
+
+        Args:
+            document_content: The document text to answer questions from
+            questions: List of questions to answer
+            document_metadata: Optional metadata about document pages (for PDFs)
+
+        Yields:
+            {"question", "answer"} dictionaries
+        """
+        async for event in self.stream_answers(document_content, questions, document_metadata):
+            if event["event"] == "done":
+                yield {"question": event["question"], "answer": event["answer"]}
+
+    async def submit_batch(
+        self, document_content: str, questions: List[str], document_metadata: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        Submit questions to the OpenAI Batch API for non-interactive workloads.
+
+        Retrieval and the semantic answer cache work exactly as in answer_questions, but
+        the remaining chat completions are submitted as a single batch job, which is billed
+        at a discount in exchange for asynchronous turnaround (up to 24 hours). The job is
+        persisted under the batch state directory and its results are collected with
+        get_batch, so it survives restarts of the service.
 
         Args:
             document_content: The document text to answer questions from
@@ -45,11 +376,445 @@ class QAService:
             document_metadata: Optional metadata about document pages (for PDFs)
 
         Returns:
-            List of dictionaries with question-answer pairs
+            Batch job dictionary with "batch_id", "status" and, once completed, "answers";
+            when every answer is cached no job is submitted and batch_id is None
+        """
+        questions, question_vectors, retrieved = await self._retrieve(document_content, questions, document_metadata)
+        document_hash = self._document_hash(document_content)
+
+        answers = self._lookup_cached_answers(document_hash, question_vectors, retrieved)
+        pending = [idx for idx, answer in enumerate(answers) if answer is None]
+        if not pending:
+            pairs = [{"question": question, "answer": answer} for question, answer in zip(questions, answers)]
+            return {"batch_id": None, "status": "completed", "answers": pairs}
+
+        if not _ensure_private_dir(self._batch_state_dir):
+            raise RuntimeError(f"Batch state directory {self._batch_state_dir} is not private to this user")
+
+        prompts = self._build_prompts([questions[idx] for idx in pending], [retrieved[idx] for idx in pending])
+        client = self._batch_client()
+        batch_file = await client.files.create(
+            file=("qa_batch.jsonl", self._build_batch_requests(dict(zip(pending, prompts)), document_hash)), purpose="batch"
+        )
+        try:
+            batch = await client.batches.create(
+                input_file_id=batch_file.id, endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW
+            )
+        except Exception:
+            await self._delete_batch_files(client, [batch_file.id])
+            raise
+
+        state = {
+            "batch_id": batch.id,
+            "status": batch.status,
+            "document_hash": document_hash,
+            "questions": questions,
+            "answers": answers,
+            # Kept to add the answers to the semantic answer cache once they arrive
+            "pending": {
+                str(idx): {
+                    "vector": question_vectors[idx] if question_vectors is not None else None,
+                    "chunk_digests": [digest.hex() for digest in self.answer_cache.chunk_digests(retrieved[idx])],
+                }
+                for idx in pending
+            },
+        }
+        self._write_batch_state(state)
+        return {"batch_id": batch.id, "status": batch.status, "answers": None}
+
+    async def get_batch(self, batch_id: str) -> Dict:
+        """
+        Return the state of a batch job created by submit_batch, collecting its results once it has finished.
+
+        When the batch reaches a terminal state its answers are parsed, added to the
+        semantic answer cache and persisted, and its files are deleted from OpenAI.
+
+        Args:
+            batch_id: ID returned by submit_batch
+
+        Returns:
+            Batch job dictionary with "batch_id", "status" and, once finished, "answers"
+
+        Raises:
+            ValueError: If batch_id is malformed
+            KeyError: If no job with this ID was submitted
+        """
+        state = self._read_batch_state(batch_id)
+        if state["status"] not in BATCH_TERMINAL_STATUSES:
+            with self._batch_lock(batch_id) as locked:
+                # Without the lock another poller is collecting the results; report the known status
+                if locked:
+                    # Re-read under the lock, as another poller may have collected the results meanwhile
+                    state = self._read_batch_state(batch_id)
+                    if state["status"] not in BATCH_TERMINAL_STATUSES:
+                        client = self._batch_client()
+                        batch = await client.batches.retrieve(batch_id)
+                        state["status"] = batch.status
+                        if batch.status in BATCH_TERMINAL_STATUSES:
+                            await self._collect_batch(client, batch, state)
+                            self._write_batch_state(state)
+
+        if state["status"] not in BATCH_TERMINAL_STATUSES:
+            return {"batch_id": batch_id, "status": state["status"], "answers": None}
+        pairs = [{"question": question, "answer": answer} for question, answer in zip(state["questions"], state["answers"])]
+        return {"batch_id": batch_id, "status": state["status"], "answers": pairs}
+
+    async def _collect_batch(self, client: AsyncOpenAI, batch, state: Dict):
+        """Fill the answers of a finished batch into its state and delete its files."""
+        results = {}
+        # Expired and cancelled batches also report the requests that did finish in their output file
+        if batch.output_file_id:
+            content = await client.files.content(batch.output_file_id)
+            results = self._parse_batch_output(content.text)
+
+        document_hash = state["document_hash"]
+        for key, entry in state.pop("pending").items():
+            idx = int(key)
+            if idx in results:
+                state["answers"][idx] = results[idx]
+                if entry["vector"] is not None:
+                    chunk_digests = [bytes.fromhex(digest) for digest in entry["chunk_digests"]]
+                    self.answer_cache.add_digests(document_hash, entry["vector"], chunk_digests, results[idx])
+            elif batch.status == "completed":
+                state["answers"][idx] = "Error answering question: no answer returned by batch"
+            else:
+                state["answers"][idx] = f"Error answering question: batch ended with status '{batch.status}'"
+
+        file_ids = [batch.input_file_id, batch.output_file_id, batch.error_file_id]
+        await self._delete_batch_files(client, [file_id for file_id in file_ids if file_id])
+
+    def _build_batch_requests(self, prompts: Dict[int, str], prompt_cache_key: str) -> bytes:
+        """Return the JSONL batch input file with one chat completion request per prompt, keyed by question index."""
+        lines = []
+        for idx, prompt in prompts.items():
+            request = {
+                "custom_id": str(idx),
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": self.llm.model_name,
+                    "temperature": self.llm.temperature,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "prompt_cache_key": prompt_cache_key,
+                },
+            }
+            lines.append(json.dumps(request))
+        return "\n".join(lines).encode("utf-8")
+
+    @staticmethod
+    def _parse_batch_output(content: str) -> Dict[int, str]:
+        """Return answers keyed by question index from a batch output file; failed requests are skipped."""
+        answers = {}
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") == 200:
+                answers[int(result["custom_id"])] = response["body"]["choices"][0]["message"]["content"]
+        return answers
+
+    @staticmethod
+    async def _delete_batch_files(client: AsyncOpenAI, file_ids: List[str]):
+        """Delete batch files from OpenAI storage; cleanup is best-effort."""
+        for file_id in file_ids:
+            try:
+                await client.files.delete(file_id)
+            except Exception:
+                pass
+
+    def _batch_client(self) -> AsyncOpenAI:
+        """Return an OpenAI client for the Batch and Files APIs, sharing the pooled HTTP client."""
+        return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=self._http_async_client)
+
+    def _batch_state_path(self, batch_id: str) -> Path:
+        """Return the state file of a batch job, rejecting IDs that could escape the state directory."""
+        if not BATCH_ID_PATTERN.fullmatch(batch_id):
+            raise ValueError(f"Invalid batch ID: {batch_id}")
+        return self._batch_state_dir / f"{batch_id}.json"
+
+    @contextmanager
+    def _batch_lock(self, batch_id: str) -> Iterator[bool]:
+        """
+        Try to take the exclusive lock for collecting a batch's results, without waiting.
+
+        The lock is a flock on a file in the batch state directory, so it also holds
+        across Uvicorn workers. Yields whether the lock was acquired.
+        """
+        lock_path = self._batch_state_path(batch_id).with_name(f".{batch_id}.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            # Released when the file is closed
+            yield True
+
+    def _read_batch_state(self, batch_id: str) -> Dict:
+        """Load the persisted state of a batch job."""
+        path = self._batch_state_path(batch_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(batch_id)
+
+    def _write_batch_state(self, state: Dict):
+        """Persist the state of a batch job, atomically so concurrent pollers never read a partial file."""
+        path = self._batch_state_path(state["batch_id"])
+        fd, tmp_path = tempfile.mkstemp(dir=self._batch_state_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _answer_chain(self, document_hash: str) -> Runnable:
+        """
+        Return the LCEL chain turning a rendered prompt into an answer string.
+
+        The document hash is sent as prompt_cache_key, which is identical across all
+        questions of one document, so the provider can reuse the cached prompt prefix.
+        """
+        return self.llm.bind(extra_body={"prompt_cache_key": document_hash}) | StrOutputParser()
+
+    def _lookup_cached_answers(
+        self, document_hash: str, question_vectors: Optional[List[List[float]]], retrieved: List[List[str]]
+    ) -> List[Optional[str]]:
+        """Return the cached answer for each question, or None where it must be generated."""
+        if question_vectors is None:
+            # Whole-document questions bypass the semantic answer cache (see _retrieve)
+            return [None] * len(retrieved)
+        return [self.answer_cache.lookup(document_hash, vector, chunks) for vector, chunks in zip(question_vectors, retrieved)]
+
+    def _cache_answer(
+        self,
+        document_hash: str,
+        question_vectors: Optional[List[List[float]]],
+        retrieved: List[List[str]],
+        idx: int,
+        answer: str,
+    ):
+        """Add a generated answer to the semantic answer cache, unless the question bypasses it."""
+        if question_vectors is not None:
+            self.answer_cache.add(document_hash, question_vectors[idx], retrieved[idx], answer)
+
+    async def _retrieve(
+        self, document_content: str, questions: List[str], document_metadata: Optional[List[Dict]] = None
+    ) -> Tuple[List[str], Optional[List[List[float]]], List[List[str]]]:
+        """
+        Load the vector store for a document and retrieve the top chunks for each question.
+
+        Documents that fit in the model's context window skip retrieval; the whole document
+        is returned as the single "chunk" of every question and no embeddings are returned.
+
+        Returns:
+            Tuple of (non-empty questions, their embeddings or None, retrieved chunk texts for each question)
         """
         if not document_content or not document_content.strip():
             raise ValueError("Document content is empty")
 
+        loop = asyncio.get_running_loop()
+        questions = [question for question in questions if question and question.strip()]
+
+        try:
+            # Tokenizing is CPU-bound and the first call may download the tokenizer's BPE file
+            fits_in_context = await loop.run_in_executor(None, self._fits_in_context, document_content)
+        except Exception:
+            # Without a tokenizer, fall back to retrieval, which works for documents of any size
+            fits_in_context = False
+
+        if fits_in_context:
+            # Small documents are used whole as the context of every question (cache-augmented
+            # generation): no chunking, index build or retrieval, and the identical document
+            # block is served from the provider's prompt cache after the first question.
+            # The semantic answer cache is bypassed: every question shares the same single
+            # "chunk", so its chunk-overlap check cannot tell apart near-miss questions
+            # ("revenue in 2022?" vs "in 2023?") that cosine similarity alone lets through.
+            return questions, None, [[document_content] for _ in questions]
+
+        # Index loading/building does blocking I/O and CPU work, so it runs in a worker thread
+        build = loop.run_in_executor(None, self._load_vectorstore, document_content, document_metadata)
+        if not questions:
+            await build
+            return [], [], []
+
+        # Embed all questions in a single round-trip, overlapped with the index build
+        vectorstore, question_vectors = await asyncio.gather(build, self.embeddings.aembed_documents(questions))
+
+        # Retrieve top-k chunks for each question
+        retrieved = await loop.run_in_executor(None, self._search, vectorstore, question_vectors)
+        return questions, question_vectors, retrieved
+
+    @staticmethod
+    def _search(vectorstore: FAISS, question_vectors: List[List[float]]) -> List[List[str]]:
+        """Return the texts of the top-k distinct chunks for each question vector."""
+        retrieved = []
+        for vector in question_vectors:
+            # Identical chunks share a vector and are returned together, so drop repeats that would
+            # duplicate context and fetch more hits until k distinct chunks remain or the index runs out
+            fetch_k = RETRIEVAL_K
+            while True:
+                docs = vectorstore.similarity_search_by_vector(vector, k=fetch_k)
+                chunks = list(dict.fromkeys(doc.page_content for doc in docs))
+                if len(chunks) >= RETRIEVAL_K or len(docs) < fetch_k:
+                    break
+                fetch_k *= 2
+            retrieved.append(chunks[:RETRIEVAL_K])
+        return retrieved
+
+    @staticmethod
+    def _build_prompts(questions: List[str], retrieved: List[List[str]]) -> List[str]:
+        """
+        Render a cache-friendly prompt for each question from its retrieved chunks.
+
+        Chunks retrieved by a majority of the questions form a shared context block that is
+        identical across prompts, so it can be served from the provider's prompt cache. The
+        remaining chunks retrieved for each question follow it. Questions without remaining
+        chunks (including every question about a small, whole document) use CAG_PROMPT.
+        """
+        # Chunks retrieved by most questions go into the shared block, ordered by frequency
+        counts = Counter(chunk for chunks in retrieved for chunk in dict.fromkeys(chunks))
+        shared = [chunk for chunk, count in counts.most_common() if count * 2 > len(questions)]
+        shared_set = set(shared)
+        shared_context = "\n\n".join(shared)
+
+        prompts = []
+        for question, chunks in zip(questions, retrieved):
+            context = "\n\n".join(chunk for chunk in chunks if chunk not in shared_set)
+            if context:
+                prompts.append(PROMPT.format(shared_context=shared_context, context=context, question=question))
+            else:
+                prompts.append(CAG_PROMPT.format(context=shared_context, question=question))
+        return prompts
+
+    def _fits_in_context(self, document_content: str) -> bool:
+        """Return whether the document is small enough to be sent whole instead of retrieved from."""
+        # A token is rarely longer than a few characters; skip tokenizing documents that are clearly too large
+        if len(document_content) > CAG_MAX_TOKENS * 10:
+            return False
+        try:
+            encoding = tiktoken.encoding_for_model(self.llm.model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return len(encoding.encode(document_content, disallowed_special=())) < CAG_MAX_TOKENS
+
+    def _load_vectorstore(self, document_content: str, document_metadata: Optional[List[Dict]] = None) -> FAISS:
+        """
+        Return the FAISS vector store for a document, reusing a cached index when available.
+
+        Indices are persisted under the cache directory keyed by document hash, so repeat
+        uploads of the same document skip chunking and embedding entirely. The chunked
+        documents are saved with the index (as JSON, see _save_vectorstore) and are
+        restored together with it, so no separate chunk cache is needed.
+        """
+        cache_path = self._index_cache_dir / self._index_cache_key(document_content, document_metadata)
+        # Cached chunks are used as LLM context, so only use a directory nobody else can write to
+        cache_usable = _ensure_private_dir(self._index_cache_dir)
+
+        if cache_usable and cache_path.exists():
+            try:
+                vectorstore = self._load_cached_vectorstore(cache_path)
+                os.utime(cache_path)  # Mark as recently used for LRU eviction
+                return vectorstore
+            except Exception:
+                # Corrupt or incompatible entry; rebuild it below
+                shutil.rmtree(cache_path, ignore_errors=True)
+
+        documents = self._chunk_document(document_content, document_metadata)
+
+        # Create vector store for RAG retrieval using FAISS
+        texts = [doc.page_content for doc in documents]
+        vectorstore = FAISS.from_embeddings(
+            text_embeddings=list(zip(texts, self._embed_unique(texts))),
+            embedding=self.embeddings,
+            metadatas=[doc.metadata for doc in documents],
+        )
+        if len(documents) >= HNSW_MIN_CHUNKS:
+            # Exact search is O(N) per query; switch large documents to an approximate index
+            vectorstore.index = _build_ann_index(vectorstore.index)
+
+        if not cache_usable:
+            return vectorstore
+
+        try:
+            # Write to a temporary directory and rename, so concurrent readers never see a partial index
+            tmp_path = Path(tempfile.mkdtemp(dir=self._index_cache_dir, prefix=".tmp-"))
+            self._save_vectorstore(vectorstore, tmp_path)
+            try:
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                # Another request cached the same document first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            self._evict_index_cache()
+        except OSError:
+            # Caching is best-effort; the freshly built index is still usable
+            pass
+
+        return vectorstore
+
+    @staticmethod
+    def _save_vectorstore(vectorstore: FAISS, path: Path):
+        """
+        Save a vector store as its FAISS index and a JSON file of its chunks in index order.
+
+        Unlike FAISS.save_local, which pickles the docstore, nothing is unpickled on load.
+        """
+        faiss.write_index(vectorstore.index, str(path / "index.faiss"))
+        chunks = []
+        for idx in range(len(vectorstore.index_to_docstore_id)):
+            doc_id = vectorstore.index_to_docstore_id[idx]
+            doc = vectorstore.docstore.search(doc_id)
+            chunks.append({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata})
+        with open(path / "chunks.json", "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+
+    def _load_cached_vectorstore(self, cache_path: Path) -> FAISS:
+        """
+        Load a vector store saved with _save_vectorstore, memory-mapping its index.
+
+        Mapping the index file read-only lets every Uvicorn worker share one copy of the
+        vectors through the OS page cache instead of each holding its own.
+        """
+        with open(cache_path / "chunks.json", "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        index = _read_index(str(cache_path / "index.faiss"))
+        if index.ntotal != len(chunks):
+            raise ValueError(f"Cached index at {cache_path} does not match its chunks")
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(
+                {chunk["id"]: Document(page_content=chunk["page_content"], metadata=chunk["metadata"]) for chunk in chunks}
+            ),
+            index_to_docstore_id={idx: chunk["id"] for idx, chunk in enumerate(chunks)},
+        )
+
+    def _embed_unique(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, sending each distinct text to the embeddings API only once.
+
+        Repeated headers, footers and boilerplate produce identical chunks; their vector
+        is computed once and shared by every occurrence.
+        """
+        seen: Dict[bytes, int] = {}
+        unique_texts: List[str] = []
+        assign: List[int] = []
+        for text in texts:
+            digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+            if digest not in seen:
+                seen[digest] = len(unique_texts)
+                unique_texts.append(text)
+            assign.append(seen[digest])
+
+        vectors = self.embeddings.embed_documents(unique_texts)
+        return [vectors[idx] for idx in assign]
+
+    def _chunk_document(self, document_content: str, document_metadata: Optional[List[Dict]] = None) -> List[Document]:
+        """Split a document into chunks, preserving page metadata when available."""
         # Create document chunks with metadata if available
         if document_metadata:
             # Create documents with page metadata for better retrieval
@@ -72,56 +837,33 @@ class QAService:
         if not documents:
             raise ValueError("No document chunks created. Document may be empty or unreadable.")
 
-        # Create vector store for RAG retrieval using FAISS
-        vectorstore = FAISS.from_documents(documents=documents, embedding=self.embeddings)
-
-        # Enhanced prompt for better RAG responses
-        prompt_template = """You are a helpful assistant that answers questions based on the provided context from a document.
-
-Use the following pieces of context to answer the question accurately and comprehensively.
-- If the answer is not in the context, say "I don't know" based on the provided context.
-- Do not make up information that is not in the context.
-- Provide detailed and accurate answers based solely on the context provided.
-- If multiple relevant pieces of context are provided, synthesize them into a comprehensive answer.
-
-Context from document:
-{context}
-
-Question: {question}
+        return documents
 
-Provide a clear, accurate answer based on the context above:"""
-
-        PROMPT = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-
-        # Create RAG chain with optimized retrieval
-        # Using similarity search with top-k retrieval
-        # Increased k from 5 to 10 to retrieve more relevant chunks for comprehensive answers
-        retriever = vectorstore.as_retriever(
-            search_type="similarity", search_kwargs={"k": 10}  # Retrieve top 10 most relevant chunks for better context
-        )
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",  # Stuff all retrieved chunks into prompt
-            retriever=retriever,
-            chain_type_kwargs={"prompt": PROMPT},
-            return_source_documents=False,
-        )
+    def _index_cache_key(self, document_content: str, document_metadata: Optional[List[Dict]] = None) -> str:
+        """Return the index cache key for a document, including page metadata when it affects chunking."""
+        key = self._document_hash(document_content)
+        if document_metadata:
+            metadata_digest = hashlib.sha256(json.dumps(document_metadata, sort_keys=True).encode("utf-8")).hexdigest()
+            key = hashlib.sha256(f"{key}:{metadata_digest}".encode("utf-8")).hexdigest()
+        return key
 
-        # Answer each question using RAG
-        qa_dict = {}
-        for question in questions:
-            if not question or not question.strip():
+    def _evict_index_cache(self):
+        """Remove least recently used cached indices until the cache fits within its size cap."""
+        entries = []
+        for path in self._index_cache_dir.iterdir():
+            if not path.is_dir() or path.name.startswith("."):
                 continue
+            size = sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+            entries.append((path.stat().st_mtime, size, path))
 
-            try:
-                # Invoke RAG chain: retrieves relevant chunks and generates answer
-                result = qa_chain.invoke({"query": question})
-                answer = result.get("result", "I don't know the answer to this question based on the provided document.")
-                qa_dict[question] = answer
-            except Exception as e:
-                # If there's an error answering a question, return error message
-                qa_dict[question] = f"Error answering question: {str(e)}"
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self._index_cache_max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
 
-        # Convert to list of dicts format for API response
-        return [qa_dict]
+    @staticmethod
+    def _document_hash(document_content: str) -> str:
+        """Return a stable hash identifying the document content."""
+        return hashlib.sha256(document_content.encode("utf-8")).hexdigest()
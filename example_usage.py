@@ -4,9 +4,11 @@ Example script to test the Question-Answering API.
 This script demonstrates how to use the API with sample files.
 Make sure the API server is running before executing this script.
 """
-import requests
+import asyncio
 import json
 
+import httpx
+
 # API endpoint
 API_URL = "http://localhost:8000/qa"
 
@@ -15,22 +17,25 @@ DOCUMENT_FILE = "sample_document.json"
 QUESTIONS_FILE = "sample_questions.json"
 
 
-def test_api():
+async def test_api():
     """Test the QA API with sample files."""
     try:
-        # Prepare files
-        with open(DOCUMENT_FILE, 'rb') as doc_file, \
-             open(QUESTIONS_FILE, 'rb') as questions_file:
-            
-            files = {
-                'document': (DOCUMENT_FILE, doc_file, 'application/json'),
-                'questions_file': (QUESTIONS_FILE, questions_file, 'application/json')
-            }
-            
-            # Make request
-            print("Sending request to API...")
-            response = requests.post(API_URL, files=files)
-            
+        # One client for all requests, so the connection is reused across calls;
+        # HTTP/2 is negotiated when the server is reached over TLS
+        async with httpx.AsyncClient(http2=True, timeout=None) as client:
+            # Prepare files
+            with open(DOCUMENT_FILE, 'rb') as doc_file, \
+                 open(QUESTIONS_FILE, 'rb') as questions_file:
+
+                files = {
+                    'document': (DOCUMENT_FILE, doc_file, 'application/json'),
+                    'questions_file': (QUESTIONS_FILE, questions_file, 'application/json')
+                }
+
+                # Make request
+                print("Sending request to API...")
+                response = await client.post(API_URL, files=files)
+
             # Check response
             if response.status_code == 200:
                 result = response.json()
@@ -39,11 +44,11 @@ def test_api():
             else:
                 print(f"\n❌ Error: {response.status_code}")
                 print(response.text)
-                
+
     except FileNotFoundError as e:
         print(f"❌ File not found: {e}")
         print("Make sure sample_document.json and sample_questions.json exist.")
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("❌ Connection error. Make sure the API server is running.")
         print("Start the server with: uvicorn app.main:app --reload")
     except Exception as e:
@@ -51,5 +56,4 @@ def test_api():
 
 
 if __name__ == "__main__":
-    test_api()
-
+    asyncio.run(test_api())
@@ -0,0 +1,59 @@
+"""
+Tests for the semantic answer cache.
+"""
+import pytest
+from app.services.answer_cache import SemanticAnswerCache
+
+
+@pytest.fixture
+def answer_cache():
+    """Create a SemanticAnswerCache instance."""
+    return SemanticAnswerCache(similarity_threshold=0.9, min_chunk_overlap=0.5)
+
+
+def test_lookup_empty_cache(answer_cache):
+    """Test lookup on a document with no cached answers."""
+    assert answer_cache.lookup("doc", [1.0, 0.0, 0.0], ["a"]) is None
+
+
+def test_lookup_similar_question(answer_cache):
+    """Test that a similar question with the same retrieved chunks is a hit."""
+    answer_cache.add("doc", [1.0, 0.0, 0.0], ["a", "b"], "cached answer")
+    assert answer_cache.lookup("doc", [0.99, 0.05, 0.0], ["a", "b"]) == "cached answer"
+
+
+def test_lookup_dissimilar_question(answer_cache):
+    """Test that a dissimilar question is a miss."""
+    answer_cache.add("doc", [1.0, 0.0, 0.0], ["a", "b"], "cached answer")
+    assert answer_cache.lookup("doc", [0.0, 1.0, 0.0], ["a", "b"]) is None
+
+
+def test_lookup_requires_chunk_overlap(answer_cache):
+    """Test that a similar question retrieving different chunks is a miss."""
+    answer_cache.add("doc", [1.0, 0.0, 0.0], ["a", "b"], "cached answer")
+    assert answer_cache.lookup("doc", [1.0, 0.0, 0.0], ["c", "d"]) is None
+
+
+def test_lookup_is_scoped_to_document(answer_cache):
+    """Test that answers are not shared between documents."""
+    answer_cache.add("doc", [1.0, 0.0, 0.0], ["a"], "cached answer")
+    assert answer_cache.lookup("other-doc", [1.0, 0.0, 0.0], ["a"]) is None
+
+
+def test_least_recently_used_document_evicted():
+    """Test that the least recently used document is dropped past max_documents."""
+    answer_cache = SemanticAnswerCache(max_documents=1)
+    answer_cache.add("first", [1.0, 0.0], ["a"], "first answer")
+    answer_cache.add("second", [1.0, 0.0], ["a"], "second answer")
+    assert answer_cache.lookup("first", [1.0, 0.0], ["a"]) is None
+    assert answer_cache.lookup("second", [1.0, 0.0], ["a"]) == "second answer"
+
+
+def test_entries_store_chunk_digests(answer_cache):
+    """Test that cached entries keep short digests rather than the chunk texts."""
+    chunk = "long chunk text " * 1000
+    answer_cache.add("doc", [1.0, 0.0, 0.0], [chunk], "cached answer")
+    (chunk_ids, _), = answer_cache._documents["doc"][1]
+    assert chunk not in chunk_ids
+    assert all(len(chunk_id) == 16 for chunk_id in chunk_ids)
+    assert answer_cache.lookup("doc", [1.0, 0.0, 0.0], [chunk]) == "cached answer"
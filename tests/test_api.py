@@ -5,7 +5,25 @@ import pytest
 import json
 from io import BytesIO
 from fastapi.testclient import TestClient
-from app.main import app
+from app.main import app, get_qa_service
+
+
+class FakeQAService:
+    """QA service returning canned answers, interleaving the token streams of all questions."""
+
+    async def answer_questions(self, document_content, questions, document_metadata=None):
+        return [{"question": question, "answer": f"Answer {idx}"} for idx, question in enumerate(questions)]
+
+    async def iter_answers(self, document_content, questions, document_metadata=None):
+        for pair in reversed(await self.answer_questions(document_content, questions, document_metadata)):
+            yield pair
+
+    async def stream_answers(self, document_content, questions, document_metadata=None):
+        for token in ("Ans", "wer"):
+            for idx in range(len(questions)):
+                yield {"event": "token", "question_id": idx, "token": f"{token} {idx}"}
+        for idx, question in enumerate(questions):
+            yield {"event": "done", "question_id": idx, "question": question, "answer": f"Answer {idx}"}
 
 
 @pytest.fixture
@@ -15,6 +33,14 @@ def client():
 
 
 @pytest.fixture
+def fake_client():
+    """Create a test client whose QA service is replaced by FakeQAService."""
+    app.dependency_overrides[get_qa_service] = FakeQAService
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="session")
 def sample_json_document():
     """Sample JSON document."""
     return json.dumps({
@@ -23,7 +49,7 @@ def sample_json_document():
     }).encode('utf-8')
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_questions():
     """Sample questions JSON."""
     return json.dumps({
@@ -63,3 +89,81 @@ def test_qa_endpoint_invalid_questions_format(client, sample_json_document):
     response = client.post("/qa", files=files)
     assert response.status_code == 400
 
+
+def test_qa_endpoint_answers(fake_client, sample_json_document, sample_questions):
+    """Test that answers are returned as a list of question-answer pairs in question order."""
+    files = {
+        "document": ("test.json", BytesIO(sample_json_document), "application/json"),
+        "questions_file": ("questions.json", BytesIO(sample_questions), "application/json")
+    }
+    response = fake_client.post("/qa", files=files)
+    assert response.status_code == 200
+    assert response.json() == {
+        "answers": [
+            {"question": "What is Python?", "answer": "Answer 0"},
+            {"question": "What is Python used for?", "answer": "Answer 1"},
+        ]
+    }
+
+
+def test_qa_ndjson_endpoint(fake_client, sample_json_document, sample_questions):
+    """Test that each question-answer pair is streamed as one JSON line."""
+    files = {
+        "document": ("test.json", BytesIO(sample_json_document), "application/json"),
+        "questions_file": ("questions.json", BytesIO(sample_questions), "application/json")
+    }
+    response = fake_client.post("/qa/ndjson", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"question": "What is Python used for?", "answer": "Answer 1"},
+        {"question": "What is Python?", "answer": "Answer 0"},
+    ]
+
+
+def test_qa_ndjson_endpoint_invalid_questions_format(fake_client, sample_json_document):
+    """Test NDJSON QA endpoint with invalid questions format."""
+    files = {
+        "document": ("test.json", BytesIO(sample_json_document), "application/json"),
+        "questions_file": ("questions.json", BytesIO(b"invalid json"), "application/json")
+    }
+    response = fake_client.post("/qa/ndjson", files=files)
+    assert response.status_code == 400
+
+
+def test_qa_stream_endpoint_invalid_questions_format(client, sample_json_document):
+    """Test streaming QA endpoint with invalid questions format."""
+    files = {
+        "document": ("test.json", BytesIO(sample_json_document), "application/json"),
+        "questions_file": ("questions.json", BytesIO(b"invalid json"), "application/json")
+    }
+    response = client.post("/qa/stream", files=files)
+    assert response.status_code == 400
+
+
+def test_qa_stream_endpoint_events(fake_client, sample_json_document, sample_questions):
+    """Test that streamed events are framed as SSE and can be demultiplexed by question_id."""
+    files = {
+        "document": ("test.json", BytesIO(sample_json_document), "application/json"),
+        "questions_file": ("questions.json", BytesIO(sample_questions), "application/json")
+    }
+    response = fake_client.post("/qa/stream", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    tokens = {}
+    done = {}
+    for frame in response.text.split("\n\n"):
+        if not frame:
+            continue
+        event_line, data_line = frame.split("\n")
+        event = event_line.removeprefix("event: ")
+        data = json.loads(data_line.removeprefix("data: "))
+        if event == "token":
+            tokens.setdefault(data["question_id"], []).append(data["token"])
+        else:
+            assert event == "done"
+            done[data["question_id"]] = data
+    assert tokens == {0: ["Ans 0", "wer 0"], 1: ["Ans 1", "wer 1"]}
+    assert [done[idx]["question"] for idx in (0, 1)] == ["What is Python?", "What is Python used for?"]
+    assert done[1]["answer"] == "Answer 1"
@@ -0,0 +1,76 @@
+"""
+Tests for the batching embedder.
+"""
+import asyncio
+import pytest
+from langchain_core.embeddings import Embeddings
+from app.services.batching_embedder import BatchingEmbedder
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings that record each call and return the text length as the vector."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+@pytest.fixture
+def fake_embeddings():
+    """Create a FakeEmbeddings instance."""
+    return FakeEmbeddings()
+
+
+def test_embed_documents(fake_embeddings):
+    """Test that a single caller gets its own vectors back."""
+    embedder = BatchingEmbedder(fake_embeddings)
+    assert embedder.embed_documents(["a", "bb"]) == [[1.0], [2.0]]
+
+
+def test_embed_documents_empty(fake_embeddings):
+    """Test that no call is made for an empty list."""
+    embedder = BatchingEmbedder(fake_embeddings)
+    assert embedder.embed_documents([]) == []
+    assert fake_embeddings.calls == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_batch(fake_embeddings):
+    """Test that concurrent requests are coalesced and demultiplexed correctly."""
+    embedder = BatchingEmbedder(fake_embeddings, max_wait_ms=100)
+    first, second = await asyncio.gather(embedder.aembed_documents(["a", "bb"]), embedder.aembed_documents(["ccc"]))
+    assert first == [[1.0], [2.0]]
+    assert second == [[3.0]]
+    assert len(fake_embeddings.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_callers():
+    """Test that a failed batch raises in every caller."""
+
+    class FailingEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("embedding failed")
+
+    embedder = BatchingEmbedder(FailingEmbeddings())
+    with pytest.raises(RuntimeError):
+        await embedder.aembed_documents(["a"])
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_block_others(fake_embeddings):
+    """Test that cancelling one caller still delivers the other callers' vectors."""
+    embedder = BatchingEmbedder(fake_embeddings, max_wait_ms=100)
+    first = asyncio.create_task(embedder.aembed_documents(["a"]))
+    second = asyncio.create_task(embedder.aembed_documents(["bb"]))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await asyncio.wait_for(second, timeout=5) == [[2.0]]
+    assert fake_embeddings.calls == [["bb"]]
@@ -3,8 +3,10 @@ Tests for document loader service.
 """
 import pytest
 import json
+import tempfile
 from io import BytesIO
 from fastapi import UploadFile
+from app.services import document_loader as document_loader_module
 from app.services.document_loader import DocumentLoader
 
 
@@ -21,7 +23,7 @@ def sample_pdf_content():
     return b"%PDF-1.4\n1 0 obj\n<< /Type /Catalog >>\nendobj\nxref\n0 1\ntrailer\n<< /Size 1 /Root 1 0 R >>\nstartxref\n9\n%%EOF"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_json_content():
     """Sample JSON document content."""
     return json.dumps({
@@ -30,7 +32,7 @@ def sample_json_content():
     }).encode('utf-8')
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_questions_json():
     """Sample questions JSON content."""
     return json.dumps({
@@ -89,3 +91,37 @@ async def test_load_document_unsupported_format(document_loader):
     with pytest.raises(ValueError):
         await document_loader.load_document(file)
 
+
+@pytest.mark.asyncio
+async def test_spool_upload_removes_file_on_read_error(document_loader, tmp_path, monkeypatch):
+    """Test that the temporary file is removed when reading the upload fails midway."""
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    class FailingUpload:
+        async def read(self, size):
+            raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        async with document_loader.spool_upload(FailingUpload()):
+            pass
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parallel_pdf_extraction_matches_sequential(tmp_path, monkeypatch):
+    """Test that pypdf extraction split across worker processes returns the pages in order."""
+    fitz = pytest.importorskip("fitz")
+    path = str(tmp_path / "pages.pdf")
+    with fitz.open() as doc:
+        for page_num in range(10):
+            doc.new_page().insert_text((72, 72), f"Page {page_num} text")
+        doc.save(path)
+
+    monkeypatch.setattr(document_loader_module, "fitz", None)
+    monkeypatch.setattr(document_loader_module, "PARALLEL_PDF_MIN_PAGES", 2)
+    monkeypatch.setattr(document_loader_module.os, "cpu_count", lambda: 1)
+    sequential = document_loader_module._extract_pages(path)
+
+    # Three workers get uneven ranges of 4, 4 and 2 pages
+    monkeypatch.setattr(document_loader_module.os, "cpu_count", lambda: 3)
+    assert document_loader_module._extract_pages(path) == sequential
+    assert [text.strip() for text in sequential] == [f"Page {page_num} text" for page_num in range(10)]
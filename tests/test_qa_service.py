@@ -0,0 +1,359 @@
+"""
+Tests for QA service internals that need no network access.
+"""
+import hashlib
+import json
+from types import SimpleNamespace
+import pytest
+import requests
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.embeddings import Embeddings
+from app.services.answer_cache import SemanticAnswerCache
+from langchain_community.vectorstores import FAISS
+from app.services import qa_service as qa_service_module
+from app.services.qa_service import RETRIEVAL_K, QAService
+
+DOCUMENT = "\n\n".join(f"Paragraph {i} talks about topic number {i}. " * 20 for i in range(20))
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic embeddings derived from a hash of the text, counting embedded texts."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    @staticmethod
+    def _vector(text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:8]]
+
+
+@pytest.fixture
+def qa_service(tmp_path, monkeypatch):
+    """Create a QAService with stub embeddings and a cache under tmp_path."""
+    monkeypatch.setenv("FAISS_CACHE_DIR", str(tmp_path / "faiss"))
+    monkeypatch.setenv("QA_BATCH_STATE_DIR", str(tmp_path / "batches"))
+    service = QAService(answer_cache=SemanticAnswerCache())
+    service.embeddings = StubEmbeddings()
+    return service
+
+
+class StubBatchClient:
+    """In-memory stand-in for the Files and Batches APIs of AsyncOpenAI."""
+
+    def __init__(self):
+        self.uploaded = {}
+        self.deleted = []
+        self.batch = None
+        self.retrieved = 0
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content, delete=self._delete_file)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def finish(self, output, status="completed"):
+        """End the batch with the given status and output file content."""
+        self.uploaded["file-output"] = output.encode("utf-8")
+        self.batch.status = status
+        self.batch.output_file_id = "file-output"
+
+    async def _create_file(self, file, purpose):
+        self.uploaded["file-input"] = file[1]
+        return SimpleNamespace(id="file-input")
+
+    async def _file_content(self, file_id):
+        assert file_id not in self.deleted
+        return SimpleNamespace(text=self.uploaded[file_id].decode("utf-8"))
+
+    async def _delete_file(self, file_id):
+        self.deleted.append(file_id)
+
+    async def _create_batch(self, input_file_id, endpoint, completion_window):
+        self.batch = SimpleNamespace(
+            id="batch_123", status="validating", input_file_id=input_file_id, output_file_id=None, error_file_id=None
+        )
+        return self.batch
+
+    async def _retrieve_batch(self, batch_id):
+        assert batch_id == self.batch.id
+        self.retrieved += 1
+        return self.batch
+
+
+def test_index_cache_key(qa_service):
+    """Test that the cache key depends on content and page metadata."""
+    key = qa_service._index_cache_key(DOCUMENT)
+    assert key == qa_service._index_cache_key(DOCUMENT)
+    assert key != qa_service._index_cache_key(DOCUMENT + " more")
+    metadata = [{"page_number": 1, "text": DOCUMENT, "source": "a.pdf"}]
+    assert key != qa_service._index_cache_key(DOCUMENT, metadata)
+
+
+def test_vectorstore_cache_miss_then_hit(qa_service):
+    """Test that a repeat document is loaded from the cache without embedding."""
+    first = qa_service._load_vectorstore(DOCUMENT)
+    embedded = len(qa_service.embeddings.embedded)
+    assert embedded > 0
+    assert (qa_service._index_cache_dir / qa_service._index_cache_key(DOCUMENT)).is_dir()
+
+    second = qa_service._load_vectorstore(DOCUMENT)
+    assert len(qa_service.embeddings.embedded) == embedded
+
+    vector = qa_service.embeddings.embed_query("topic number 3")
+    assert [doc.page_content for doc in first.similarity_search_by_vector(vector, k=3)] == [
+        doc.page_content for doc in second.similarity_search_by_vector(vector, k=3)
+    ]
+
+
+def test_vectorstore_cache_round_trips_metadata(qa_service):
+    """Test that cached chunks keep their page metadata and are stored without pickle."""
+    metadata = [{"page_number": 2, "text": DOCUMENT, "source": "a.pdf"}]
+    qa_service._load_vectorstore(DOCUMENT, metadata)
+    cache_path = qa_service._index_cache_dir / qa_service._index_cache_key(DOCUMENT, metadata)
+    assert sorted(f.name for f in cache_path.iterdir()) == ["chunks.json", "index.faiss"]
+
+    vectorstore = qa_service._load_vectorstore(DOCUMENT, metadata)
+    (doc,) = vectorstore.similarity_search_by_vector(qa_service.embeddings.embed_query("topic"), k=1)
+    assert doc.metadata == {"page_number": 2, "source": "a.pdf"}
+
+
+@pytest.mark.parametrize("index_type", ["IndexHNSWSQ", "IndexIVFPQ"])
+def test_vectorstore_approximate_index(qa_service, monkeypatch, index_type):
+    """Test that approximate indices map hits to the right chunks, when built and when loaded from the cache."""
+    monkeypatch.setattr(qa_service_module, "HNSW_MIN_CHUNKS", 100)
+    if index_type == "IndexIVFPQ":
+        # The stub embeddings have 8 dimensions; search every list so the check is deterministic
+        monkeypatch.setattr(qa_service_module, "IVFPQ_MIN_CHUNKS", 100)
+        monkeypatch.setattr(qa_service_module, "IVF_NLIST", 4)
+        monkeypatch.setattr(qa_service_module, "IVF_NPROBE", 4)
+        monkeypatch.setattr(qa_service_module, "PQ_M", 8)
+        monkeypatch.setattr(qa_service_module, "PQ_NBITS", 6)
+    qa_service.text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=0)
+    document = "\n\n".join(f"Section {i} describes subject number {i} in a few words." for i in range(300))
+
+    for _ in ("build", "cache"):
+        vectorstore = qa_service._load_vectorstore(document)
+        assert type(vectorstore.index).__name__ == index_type
+        assert vectorstore.index.ntotal == 300
+        for i in (0, 123, 299):
+            chunk = f"Section {i} describes subject number {i} in a few words."
+            (doc,) = vectorstore.similarity_search_by_vector(StubEmbeddings._vector(chunk), k=1)
+            assert doc.page_content == chunk
+    # The second pass loaded the cached index instead of embedding the chunks again
+    assert len(qa_service.embeddings.embedded) == 300
+
+
+def test_vectorstore_cache_ignores_shared_directory(qa_service, caplog):
+    """Test that a cache directory writable by others is neither read nor written."""
+    qa_service._index_cache_dir.mkdir(parents=True)
+    qa_service._index_cache_dir.chmod(0o777)
+
+    qa_service._load_vectorstore(DOCUMENT)
+    assert list(qa_service._index_cache_dir.iterdir()) == []
+    assert "writable by group or others" in caplog.text
+
+
+def test_vectorstore_cache_accepts_readable_directory(qa_service):
+    """Test that a cache directory only readable by others, as created by a plain mkdir, is used."""
+    qa_service._index_cache_dir.mkdir(parents=True)
+    qa_service._index_cache_dir.chmod(0o755)
+
+    qa_service._load_vectorstore(DOCUMENT)
+    assert (qa_service._index_cache_dir / qa_service._index_cache_key(DOCUMENT)).is_dir()
+
+
+def test_evict_index_cache(qa_service):
+    """Test that the least recently used entry is evicted past the size cap."""
+    qa_service._load_vectorstore(DOCUMENT)
+    old_path = qa_service._index_cache_dir / qa_service._index_cache_key(DOCUMENT)
+    entry_size = sum(f.stat().st_size for f in old_path.iterdir())
+
+    qa_service._index_cache_max_bytes = entry_size * 3 // 2
+    qa_service._load_vectorstore(DOCUMENT + " changed")
+
+    assert not old_path.exists()
+    assert (qa_service._index_cache_dir / qa_service._index_cache_key(DOCUMENT + " changed")).is_dir()
+
+
+@pytest.mark.asyncio
+async def test_batch_submit_then_poll(qa_service, monkeypatch):
+    """Test the batch input file, custom_id parsing of the output and cleanup of batch files."""
+    client = StubBatchClient()
+    monkeypatch.setattr(qa_service, "_batch_client", lambda: client)
+    monkeypatch.setattr(qa_service, "_fits_in_context", lambda document_content: False)
+    questions = ["What is topic 1?", "What is topic 2?", "What is topic 3?"]
+
+    job = await qa_service.submit_batch(DOCUMENT, questions)
+    assert job == {"batch_id": "batch_123", "status": "validating", "answers": None}
+
+    requests = [json.loads(line) for line in client.uploaded["file-input"].decode("utf-8").splitlines()]
+    assert [request["custom_id"] for request in requests] == ["0", "1", "2"]
+    assert all(request["body"]["prompt_cache_key"] == qa_service._document_hash(DOCUMENT) for request in requests)
+    assert questions[1] in requests[1]["body"]["messages"][0]["content"]
+
+    assert (await qa_service.get_batch("batch_123"))["answers"] is None
+
+    # Results arrive out of order and the request for question 1 failed
+    client.finish(
+        "\n".join(
+            json.dumps(result)
+            for result in [
+                {"custom_id": "2", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "three"}}]}}},
+                {"custom_id": "1", "response": {"status_code": 500, "body": {}}},
+                {"custom_id": "0", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "one"}}]}}},
+            ]
+        )
+    )
+    job = await qa_service.get_batch("batch_123")
+    assert job["status"] == "completed"
+    assert [pair["answer"] for pair in job["answers"]][::2] == ["one", "three"]
+    assert job["answers"][1]["answer"].startswith("Error answering question")
+    assert sorted(client.deleted) == ["file-input", "file-output"]
+
+    # Finished jobs are served from the persisted state
+    assert await qa_service.get_batch("batch_123") == job
+
+
+def batch_result(custom_id, content):
+    """Return one successful line of a batch output file."""
+    body = {"choices": [{"message": {"content": content}}]}
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": 200, "body": body}})
+
+
+@pytest.mark.asyncio
+async def test_expired_batch_keeps_finished_answers(qa_service, monkeypatch):
+    """Test that answers finished before a batch expired are kept."""
+    client = StubBatchClient()
+    monkeypatch.setattr(qa_service, "_batch_client", lambda: client)
+    monkeypatch.setattr(qa_service, "_fits_in_context", lambda document_content: False)
+    await qa_service.submit_batch(DOCUMENT, ["What is topic 1?", "What is topic 2?"])
+
+    client.finish(batch_result("1", "two"), status="expired")
+    job = await qa_service.get_batch("batch_123")
+    assert job["status"] == "expired"
+    assert job["answers"][0]["answer"] == "Error answering question: batch ended with status 'expired'"
+    assert job["answers"][1]["answer"] == "two"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_batch_polls_collect_once(qa_service, monkeypatch):
+    """Test that a poll arriving while another collects the results does not collect them again."""
+    client = StubBatchClient()
+    monkeypatch.setattr(qa_service, "_batch_client", lambda: client)
+    monkeypatch.setattr(qa_service, "_fits_in_context", lambda document_content: False)
+    await qa_service.submit_batch(DOCUMENT, ["What is topic 1?"])
+    client.finish(batch_result("0", "one"))
+
+    with qa_service._batch_lock("batch_123") as locked:
+        assert locked
+        assert await qa_service.get_batch("batch_123") == {"batch_id": "batch_123", "status": "validating", "answers": None}
+    assert client.retrieved == 0
+
+    job = await qa_service.get_batch("batch_123")
+    assert job["answers"] == [{"question": "What is topic 1?", "answer": "one"}]
+    assert await qa_service.get_batch("batch_123") == job
+    assert client.retrieved == 1
+
+
+@pytest.mark.asyncio
+async def test_get_batch_rejects_unknown_ids(qa_service):
+    """Test that malformed and unknown batch IDs are rejected."""
+    with pytest.raises(ValueError):
+        await qa_service.get_batch("../faiss")
+    with pytest.raises(KeyError):
+        await qa_service.get_batch("batch_unknown")
+
+
+@pytest.mark.asyncio
+async def test_stream_answers_reports_every_failure(qa_service, monkeypatch):
+    """Test that each question ends with one done event even when caching its answer fails."""
+
+    class StubChain:
+        async def astream(self, prompt):
+            yield "partial"
+
+    async def retrieve(document_content, questions, document_metadata=None):
+        return questions, [[1.0, 0.0] for _ in questions], [["chunk"] for _ in questions]
+
+    def fail(*args):
+        raise RuntimeError("cache unavailable")
+
+    monkeypatch.setattr(qa_service, "_retrieve", retrieve)
+    monkeypatch.setattr(qa_service, "_answer_chain", lambda document_hash: StubChain())
+    monkeypatch.setattr(qa_service.answer_cache, "add", fail)
+
+    events = [event async for event in qa_service.stream_answers(DOCUMENT, ["first?", "second?"])]
+    done = [event for event in events if event["event"] == "done"]
+    assert sorted(event["question_id"] for event in done) == [0, 1]
+    assert all("cache unavailable" in event["answer"] for event in done)
+
+
+def test_embed_unique(qa_service):
+    """Test that repeated texts are embedded once and share their vector."""
+    vectors = qa_service._embed_unique(["header", "body", "header", "footer", "header"])
+    assert qa_service.embeddings.embedded == ["header", "body", "footer"]
+    assert vectors[0] == vectors[2] == vectors[4] == StubEmbeddings._vector("header")
+    assert vectors[3] == StubEmbeddings._vector("footer")
+
+
+def test_search_returns_distinct_chunks(qa_service):
+    """Test that repeated chunks do not crowd out distinct ones from the top k."""
+    texts = ["boilerplate"] * (RETRIEVAL_K + 2) + [f"chunk {i}" for i in range(RETRIEVAL_K + 5)]
+    vectorstore = FAISS.from_embeddings(list(zip(texts, qa_service._embed_unique(texts))), qa_service.embeddings)
+    small_vectorstore = FAISS.from_embeddings(
+        list(zip(texts[: RETRIEVAL_K + 5], qa_service._embed_unique(texts[: RETRIEVAL_K + 5]))), qa_service.embeddings
+    )
+    query = StubEmbeddings._vector("boilerplate")
+
+    (chunks,) = qa_service._search(vectorstore, [query])
+    assert len(chunks) == RETRIEVAL_K
+    assert len(set(chunks)) == RETRIEVAL_K
+    assert chunks[0] == "boilerplate"
+
+    # When the index has fewer distinct chunks than k, all of them are returned
+    (chunks,) = qa_service._search(small_vectorstore, [query])
+    assert sorted(chunks) == ["boilerplate", "chunk 0", "chunk 1", "chunk 2"]
+
+
+@pytest.mark.asyncio
+async def test_retrieve_falls_back_to_rag_without_tokenizer(qa_service, monkeypatch):
+    """Test that a tokenizer that cannot be loaded sends small documents down the retrieval path."""
+
+    def unavailable(model_name):
+        raise requests.ConnectionError("tokenizer download failed")
+
+    monkeypatch.setattr(qa_service_module.tiktoken, "encoding_for_model", unavailable)
+    questions, _, retrieved = await qa_service._retrieve(DOCUMENT, ["What is topic 3?", " "])
+    assert questions == ["What is topic 3?"]
+    assert 0 < len(retrieved[0]) <= RETRIEVAL_K
+    assert DOCUMENT not in retrieved[0]
+
+
+@pytest.mark.asyncio
+async def test_small_document_bypasses_answer_cache(qa_service, monkeypatch):
+    """Test that whole-document questions are answered fresh instead of from similar cached questions."""
+
+    class StubChain:
+        async def abatch(self, prompts, config=None, return_exceptions=False):
+            return [f"answer to {prompt.split('Question: ')[1].splitlines()[0]}" for prompt in prompts]
+
+    monkeypatch.setattr(qa_service, "_fits_in_context", lambda document_content: True)
+    monkeypatch.setattr(qa_service, "_answer_chain", lambda document_hash: StubChain())
+    # Every question would look similar enough to the semantic cache
+    qa_service.answer_cache.similarity_threshold = -1.0
+
+    questions, question_vectors, retrieved = await qa_service._retrieve(DOCUMENT, ["Revenue in 2022?"])
+    assert (questions, question_vectors, retrieved) == (["Revenue in 2022?"], None, [[DOCUMENT]])
+
+    assert await qa_service.answer_questions(DOCUMENT, ["Revenue in 2022?"]) == [
+        {"question": "Revenue in 2022?", "answer": "answer to Revenue in 2022?"}
+    ]
+    assert await qa_service.answer_questions(DOCUMENT, ["Revenue in 2023?"]) == [
+        {"question": "Revenue in 2023?", "answer": "answer to Revenue in 2023?"}
+    ]
+    assert qa_service.embeddings.embedded == []